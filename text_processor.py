@@ -1,10 +1,11 @@
+import asyncio
 import configparser
 import logging
 import os
 
+from utils.partition_cache import cached_partition_pdf
 from utils.text_processing.chunk_analyser import ChunkAnalyser
 from utils.text_processing.chunk_refiner import ChunkRefiner
-from unstructured.partition.pdf import partition_pdf
 from unstructured.chunking.title import chunk_by_title
 import pandas as pd
 from langchain_pymupdf4llm import PyMuPDF4LLMLoader
@@ -22,10 +23,11 @@ logger = logging.getLogger(__name__)
 
 # Configure the logger
 logger.setLevel(logging.INFO)
-handler = logging.StreamHandler()
-formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+if not logger.handlers:  # Avoid duplicate handlers on re-import
+    handler = logging.StreamHandler()
+    formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
 
 
 # if __name__ == "__main__":
@@ -151,13 +153,20 @@ def extract_and_chunk_by_title_using_pymupdf(pdf_path):
 
 
 def text_processor_run(project_files):
-    logging.basicConfig(level=logging.INFO)
     docs_directory = "docs/"
     output_dir_base = "text_sections"
     analyser = ChunkAnalyser()
 
     subfolder_type = ""
 
+    # Build the LLM config and refiner once; the Azure client setup
+    # (connection pool, auth) is then shared across all files
+    llm_config = {
+        'deployment_name': azure_llm_config["deployment"],
+        'api_version': azure_llm_config["api_version"]
+    }
+    refiner = ChunkRefiner(**llm_config)
+
     # # Get all PDF files from the directory
     # pdf_files = [
     #     os.path.join(root, file)
@@ -168,6 +177,10 @@ def text_processor_run(project_files):
     if not project_files:
         logger.info("No PDF files found in the directory.")
     else:
+        # Chunk preparation is CPU-bound and runs per file; the refinement
+        # itself is network-bound, so jobs are collected first and the
+        # documents are then refined concurrently in one gather
+        refine_jobs = []
         for filename in project_files:
             try:
                 logger.info(f"Processing file: {filename}")
@@ -184,9 +197,11 @@ def text_processor_run(project_files):
                             2400, 3200, 4000, 4800, 5600, 6400, 7200]
                     )
 
-                    # Extract and chunk text
-                    elements = partition_pdf(
-                        filename=filename, strategy="hi_res")
+                    # Extract and chunk text; the cache only helps on
+                    # reruns, since analyse_chunks partitions with the
+                    # fast strategy
+                    elements = cached_partition_pdf(
+                        filename, strategy="hi_res")
                     chunks = chunk_by_title(
                         elements,
                         max_characters=settings.max_characters,
@@ -221,19 +236,16 @@ def text_processor_run(project_files):
                 else:
                     subfolder_type = "others"  # Default to others if no match
 
-                # Refine chunks and save output
-                llm_config = {
-                    'deployment_name': azure_llm_config["deployment"],
-                    'api_version': azure_llm_config["api_version"]
-                }
-
-                refiner = ChunkRefiner(**llm_config)
-                refiner.refine_chunks_and_save(
-                    chunks, filename, project_name, document_name, subfolder_type, output_dir_base)
+                refine_jobs.append(
+                    (chunks, filename, project_name, document_name, subfolder_type))
 
             except Exception as e:
                 logger.error(f"Error processing file {filename}: {e}")
 
+        if refine_jobs:
+            # Refine chunks and save output, several documents at a time
+            asyncio.run(refiner.arefine_many(refine_jobs, output_dir_base))
+
 
 if __name__ == "__main__":
     text_processor_run()
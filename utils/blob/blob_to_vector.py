@@ -84,19 +84,23 @@ def upload_files_to_vector_stores(client, container_client, supported_extensions
                 blob_upload_stats['failed'] += 1
                 logger.error(f"Error processing {blob.name}: {e}")
 
-    # Insert mappings into the Azure Table Storage (vecstoremap table)
-    for vector_store, mapping in vstore_mappings.items():
-        try:
-            azure_table_client.create_vs_mapping(
-                table_name="vstoremap",
-                project_name=mapping['source_name'],
-                vs_name=vector_store,  # Using vector_store_name as hashed_doc_name
-                doc_name=mapping['original_doc_name']
-            )
-            logger.info(f"Mapping inserted for vector store: {vector_store}")
-        except Exception as e:
-            logger.error(
-                f"Error inserting mapping for vector store {vector_store}: {e}")
+    # Insert mappings into the Azure Table Storage (vecstoremap table) in
+    # transactional batches rather than one REST call per mapping
+    vs_entities = [
+        {
+            'PartitionKey': mapping['source_name'],
+            'RowKey': vector_store,  # Using vector_store_name as hashed_doc_name
+            'project_name': mapping['source_name'],
+            'vs_name': vector_store,
+            'doc_name': mapping['original_doc_name'],
+            'description': "This is a document mapper for vector stores"
+        }
+        for vector_store, mapping in vstore_mappings.items()
+    ]
+    if vs_entities:
+        azure_table_client.insert_many("vstoremap", vs_entities)
+        logger.info(
+            f"Inserted {len(vs_entities)} vector store mappings into vstoremap")
 
     # Create and upload to vector stores
     for vector_store_name, files in vector_store_files.items():
@@ -1,26 +1,44 @@
-import configparser
+import functools
 import os
+import re
+import threading
 
+from azure.core.pipeline.transport import RequestsTransport
 from azure.storage.blob import BlobServiceClient
 from alive_progress import alive_bar
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils.config import get_section
+from utils.fs import iter_files
 from utils.table import azure_table_client
 
+# Number of files uploaded concurrently; blob PUTs are latency bound so
+# a moderate pool keeps the account throughput budget busy
+MAX_UPLOAD_WORKERS = 8
+
+# Parallel PUT-Block streams per blob; files above MAX_SINGLE_PUT_SIZE are
+# split into chunks uploaded concurrently by the SDK
+UPLOAD_MAX_CONCURRENCY = 4
+MAX_SINGLE_PUT_SIZE = 4 * 1024 * 1024
+
+# Classifies a subfolder name in C-level matches instead of a chain of
+# substring tests per file. Literature is tested first so names mentioning
+# both kinds keep the original "lr" classification
+_LITERATURE_RE = re.compile(r"literature")
+_IFU_RE = re.compile(r"manual|instructions for use|ifu")
+
 # --- Functions ---
 
 
-def create_container(blob_service_client, container_name, logger):
+def create_container(container_client, container_name, logger):
     """
     Create a container in Azure Blob Storage if it doesn't exist.
 
     Args:
-        blob_service_client: Azure BlobServiceClient instance
+        container_client: Azure Container client instance
         container_name (str): The name of the container to create
         logger: Centralized logger instance
     """
     try:
-        container_client = blob_service_client.get_container_client(
-            container_name)
         container_client.create_container()
         logger.info(f"Container '{container_name}' created successfully")
     except Exception as e:
@@ -31,6 +49,29 @@ def create_container(blob_service_client, container_name, logger):
             raise
 
 
+@functools.lru_cache(maxsize=4096)
+def _cached_hashed_doc(project_name, doc_name):
+    """
+    Look up the hashed document name for a (project, document) pair, memoized.
+
+    Every image inside a document folder maps to the same (project_name,
+    doc_name) pair, so caching collapses hundreds of Azure Table round
+    trips per folder into one.
+
+    Args:
+        project_name (str): The project name (partition key).
+        doc_name (str): The document folder name to look up.
+
+    Returns:
+        str: The hashed document name, or "unknown_document" if not found.
+    """
+    return azure_table_client.retrieve_by_doc_name(
+        table_name="docmap",
+        project_name=project_name,
+        doc_name=doc_name
+    ) or "unknown_document"
+
+
 def get_all_files_with_custom_blob_name(root_directories, file_type, logger, clean_project_name):
     """
     Fetch all files of a specific type from the given root directories and generate custom blob names.
@@ -50,105 +91,135 @@ def get_all_files_with_custom_blob_name(root_directories, file_type, logger, cle
         f"Scanning directories: {root_directories} for files of type '{file_type}'")
 
     for root_dir in root_directories:
-        for dirpath, _, files in os.walk(root_dir):
-            for file in files:
-                if file.endswith(file_type):  # Filter by file type
-                    local_file_path = os.path.join(dirpath, file)
-
-                    if file_type == ".txt":
-                        # Allow all .txt files
-                        # Direct file upload for text files
+        for dirpath, entry in iter_files(root_dir):
+            file = entry.name
+            if file.endswith(file_type):  # Filter by file type
+                local_file_path = entry.path
+
+                if file_type == ".txt":
+                    # Allow all .txt files within the current project scope
+                    # Direct file upload for text files
+                    if clean_project_name in local_file_path.lower().replace(" ", "_"):
                         blob_name = os.path.basename(file)
-                        all_files.append((local_file_path, blob_name))
-                    elif file_type == ".jpg":
-                        # Include only files within 'verified' subfolders
-                        if "verified" in dirpath.lower():
-                            doc_folder = os.path.basename(
-                                os.path.dirname(dirpath)).lower().replace(" ", "_")
-
-                            # Determine two and three levels up for subfolder type and source
-                            two_levels_up = Path(dirpath).parents[1]
-                            subfolder_name = os.path.basename(
-                                two_levels_up).lower().replace(" ", "_")
-                            three_levels_up = Path(dirpath).parents[2]
-                            source_name = three_levels_up.name.lower().replace(" ", "_")
-
-                            logger.debug(f"DEBUG: Doc Folder: {doc_folder}")
-                            logger.debug(
-                                f"DEBUG: Subfolder Name (two levels up): {subfolder_name}")
-
-                            # Determine subfolder type
-                            if "literature" in subfolder_name:
-                                subfolder_type = "lr"
-                            elif "manual" in subfolder_name or "instructions for use" in subfolder_name or "ifu" in subfolder_name:
-                                subfolder_type = "ifu"
-                            else:
-                                subfolder_type = "others"
-
-                            logger.debug(
-                                f"DEBUG: Subfolder Type: {subfolder_type}")
-
-                            hashed_doc = azure_table_client.retrieve_by_doc_name(
-                                table_name="docmap",
-                                project_name=source_name,
-                                doc_name=doc_folder
-                            ) or "unknown_document"
-
-                            if clean_project_name == source_name:
-                                # Generate custom blob name
-                                blob_name = f"{source_name}-{hashed_doc}-{subfolder_type}-{file}"
-                                logger.info(f"Adding {blob_name}")
-                                all_files.append((local_file_path, blob_name))
-                            else:
-                                logger.info(
-                                    f"{source_name} is not part of the the current project scope: {clean_project_name}")
+                        all_files.append(
+                            (local_file_path, blob_name, entry.stat().st_size))
+                elif file_type == ".jpg":
+                    # Include only files within 'verified' subfolders
+                    if "verified" in dirpath.lower():
+                        # One string split replaces the per-image pathlib
+                        # allocations: .../<source>/<subfolder>/<doc>/verified
+                        parts = dirpath.rsplit(os.sep, 4)
+                        doc_folder = parts[-2].lower().replace(" ", "_")
+                        subfolder_name = parts[-3].lower().replace(" ", "_")
+                        source_name = parts[-4].lower().replace(" ", "_")
+
+                        logger.debug(f"DEBUG: Doc Folder: {doc_folder}")
+                        logger.debug(
+                            f"DEBUG: Subfolder Name (two levels up): {subfolder_name}")
+
+                        # Determine subfolder type
+                        if _LITERATURE_RE.search(subfolder_name):
+                            subfolder_type = "lr"
+                        elif _IFU_RE.search(subfolder_name):
+                            subfolder_type = "ifu"
+                        else:
+                            subfolder_type = "others"
+
+                        logger.debug(
+                            f"DEBUG: Subfolder Type: {subfolder_type}")
+
+                        hashed_doc = _cached_hashed_doc(
+                            source_name, doc_folder)
+
+                        if clean_project_name == source_name:
+                            # Generate custom blob name
+                            blob_name = f"{source_name}-{hashed_doc}-{subfolder_type}-{file}"
+                            logger.info(f"Adding {blob_name}")
+                            all_files.append(
+                                (local_file_path, blob_name, entry.stat().st_size))
+                        else:
+                            logger.info(
+                                f"{source_name} is not part of the the current project scope: {clean_project_name}")
 
     logger.info(f"Found {len(all_files)} files of type '{file_type}'")
     return all_files
 
 
-def upload_files_to_blob(storage_connection_string, container_name, files_to_upload, logger):
+def _upload_one(container_client, local_file_path, blob_name, file_size):
+    """
+    Upload a single file to blob storage.
+
+    The file size comes from the scandir pass, so no extra stat() is needed
+    here; passing length lets the SDK pick single-shot vs chunked upload
+    without probing the stream.
+
+    Args:
+        container_client: Azure Container client instance
+        local_file_path (str): Path of the local file to upload.
+        blob_name (str): Name of the destination blob.
+        file_size (int): Size of the file in bytes.
+
+    Returns:
+        tuple: (success (bool), file_size (int), error (Exception or None)).
+    """
+    try:
+        blob_client = container_client.get_blob_client(blob_name)
+
+        with open(local_file_path, "rb", buffering=1024 * 1024) as data:
+            blob_client.upload_blob(
+                data, overwrite=True, length=file_size,
+                max_concurrency=UPLOAD_MAX_CONCURRENCY)
+
+        return True, file_size, None
+    except Exception as e:
+        return False, 0, e
+
+
+def upload_files_to_blob(container_client, container_name, files_to_upload, logger):
     """
     Uploads files to a specified Azure Blob Storage container, with detailed upload statistics.
+    Files are uploaded concurrently with a thread pool since each blob PUT is dominated
+    by network round trips.
 
     Args:
-        storage_connection_string (str): The connection string for Azure Storage account.
+        container_client: Azure Container client instance, shared across calls
+            so TLS handshakes are not repeated per directory.
         container_name (str): The name of the container in Azure Blob Storage.
-        files_to_upload (list): List of tuples containing (local_file_path, blob_name).
+        files_to_upload (list): List of tuples containing (local_file_path, blob_name, file_size).
         logger: Centralized logger instance
     """
     logger.info(f"Starting upload process to container '{container_name}'")
 
     try:
-        blob_service_client = BlobServiceClient.from_connection_string(
-            storage_connection_string)
-        container_client = blob_service_client.get_container_client(
-            container_name)
-        logger.info(
-            f"Successfully initialized blob service client for container '{container_name}'")
-
-        create_container(blob_service_client, container_name, logger)
+        create_container(container_client, container_name, logger)
 
         upload_stats = {'successful': 0, 'failed': 0,
                         'total_size': 0}  # Track statistics
+        stats_lock = threading.Lock()
 
         with alive_bar(len(files_to_upload), title="Uploading files", force_tty=True) as bar:
-            for local_file_path, blob_name in files_to_upload:
-                try:
-                    blob_client = container_client.get_blob_client(blob_name)
-                    file_size = os.path.getsize(local_file_path)
-
-                    with open(local_file_path, "rb") as data:
-                        blob_client.upload_blob(data, overwrite=True)
-
-                    upload_stats['successful'] += 1
-                    upload_stats['total_size'] += file_size
-                    logger.info(
-                        f"Uploaded: {local_file_path} → {container_name}/{blob_name}")
-                except Exception as e:
-                    upload_stats['failed'] += 1
-                    logger.error(f"Failed to upload {local_file_path}: {e}")
-                bar()
+            with ThreadPoolExecutor(max_workers=MAX_UPLOAD_WORKERS) as executor:
+                futures = {
+                    executor.submit(_upload_one, container_client, local_file_path, blob_name, file_size):
+                    (local_file_path, blob_name)
+                    for local_file_path, blob_name, file_size in files_to_upload
+                }
+
+                for future in as_completed(futures):
+                    local_file_path, blob_name = futures[future]
+                    success, file_size, error = future.result()
+
+                    with stats_lock:
+                        if success:
+                            upload_stats['successful'] += 1
+                            upload_stats['total_size'] += file_size
+                            logger.info(
+                                f"Uploaded: {local_file_path} → {container_name}/{blob_name}")
+                        else:
+                            upload_stats['failed'] += 1
+                            logger.error(
+                                f"Failed to upload {local_file_path}: {error}")
+                    bar()
 
         total_size_mb = upload_stats['total_size'] / (1024 * 1024)
         logger.info(
@@ -164,9 +235,7 @@ def upload_local_to_blob(logger, project_name, clean_project_name):
     """
     Main function to upload files from local directories to Azure Blob Storage.
     """
-    config = configparser.ConfigParser()
-    config.read("config.prop")
-    azure_blob_config = config["azure_blob"]
+    azure_blob_config = get_section("azure_blob")
 
     connection_string = azure_blob_config["connection_string"]
     container_name_docs = azure_blob_config["container_name_docs"]
@@ -180,6 +249,14 @@ def upload_local_to_blob(logger, project_name, clean_project_name):
 
     logger.info("Starting local to blob upload process")
 
+    # One service client for the whole run; parallel chunk threads share a
+    # widened connection pool instead of the transport default of 10
+    blob_service_client = BlobServiceClient.from_connection_string(
+        connection_string,
+        max_single_put_size=MAX_SINGLE_PUT_SIZE,
+        transport=RequestsTransport(connection_pool_maxsize=32))
+    container_clients = {}
+
     for directory, container_name in directory_container_mapping.items():
         logger.info(
             f"Processing directory '{directory}' for container '{container_name}'")
@@ -189,30 +266,15 @@ def upload_local_to_blob(logger, project_name, clean_project_name):
         files_to_upload = get_all_files_with_custom_blob_name(
             [directory], file_type, logger, clean_project_name)
 
-        # Filter files that contain clean_project_name (case-insensitive + handles spaces vs underscores)
-        filtered_files_to_upload = [
-            (file_path, file_name) for file_path, file_name in files_to_upload
-            if clean_project_name in file_path.lower().replace(" ", "_")
-        ]
-        # print("Filtered files: ", filtered_files_to_upload)
-
-        # Debugging loop
-        # for file_path, file_name in files_to_upload:
-        #     if clean_project_name in file_path:
-        #         print(f"{file_path} contains the project name.")
-        #     else:
-        #         print(f"{file_path} does NOT contain the project name.")
-
-        # print("Files to upload: ", files_to_upload)
-        # print("Container name: ", container_name)
-        # print("Files to upload: ", files_to_upload)
-
-        # Only upload filtered files. Was files_to_upload previously
-        if filtered_files_to_upload:
-            # upload_files_to_blob(
-            #     connection_string, container_name, files_to_upload, logger)
+        # Project-scope filtering happens inside the scan itself, so the
+        # returned list is already restricted to clean_project_name
+        if files_to_upload:
+            if container_name not in container_clients:
+                container_clients[container_name] = \
+                    blob_service_client.get_container_client(container_name)
             upload_files_to_blob(
-                connection_string, container_name, filtered_files_to_upload, logger)
+                container_clients[container_name], container_name,
+                files_to_upload, logger)
         else:
             logger.warning(
                 f"No files found in directory '{directory}' for upload")
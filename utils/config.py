@@ -0,0 +1,25 @@
+import configparser
+
+from pathlib import Path
+
+# Resolve config.prop relative to the repo root so loading works no matter
+# what the current working directory is
+CONFIG_PATH = Path(__file__).resolve().parents[1] / "config.prop"
+
+# Loaded once at import; every module shares this parser instead of
+# re-reading the file per call
+_CFG = configparser.ConfigParser()
+_CFG.read(CONFIG_PATH)
+
+
+def get_section(section):
+    """
+    Return a section of the shared configuration.
+
+    Args:
+        section (str): Name of the config.prop section (e.g. "azure_blob").
+
+    Returns:
+        configparser.SectionProxy: The requested section.
+    """
+    return _CFG[section]
@@ -0,0 +1,29 @@
+import os
+
+
+def iter_files(root_dir):
+    """
+    Yield (dirpath, DirEntry) pairs for every file under root_dir.
+
+    Uses os.scandir instead of os.walk so directory/file checks reuse the
+    stat info already fetched by the directory read rather than issuing an
+    extra stat() per entry.
+
+    Args:
+        root_dir (str): Root directory to traverse.
+
+    Yields:
+        tuple: (dirpath, os.DirEntry) for each regular file found.
+    """
+    stack = [str(root_dir)]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file():
+                        yield current, entry
+        except OSError:
+            continue  # Unreadable or missing directory, same as os.walk
@@ -1,15 +1,14 @@
-import base64
-import cv2
 import logging
-import numpy as np
 import os
 import re
 import shutil
 
-from alive_progress import alive_bar
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import List
-from unstructured.partition.pdf import partition_pdf
+from utils.config import get_section
+from utils.fs import iter_files
+from utils.partition_cache import cached_partition_pdf
 
 # -- Constants to prevent image cropping --
 HORIZONTAL_PAD = 50
@@ -19,6 +18,24 @@ VERTICAL_PAD = 50
 os.environ["EXTRACT_IMAGE_BLOCK_CROP_HORIZONTAL_PAD"] = str(HORIZONTAL_PAD)
 os.environ["EXTRACT_IMAGE_BLOCK_CROP_VERTICAL_PAD"] = str(VERTICAL_PAD)
 
+# Element categories counted as image context
+_CONTEXT_CATEGORIES = frozenset(
+    {"FigureCaption", "ListItem", "NarrativeText", "Title"})
+
+# Compiled scans instead of a .lower() allocation plus four substring
+# checks per directory visited. Literature is tested first so names
+# mentioning both kinds keep the original classification
+_LITERATURE_RE = re.compile(r"literature", re.IGNORECASE)
+_IFU_RE = re.compile(r"manual|instructions for use|ifu", re.IGNORECASE)
+
+# Text references such as "Table 2" that signal the document contains
+# tables the fast strategy cannot classify as Table elements
+_TABLE_TEXT_RE = re.compile(r"\btable\s+\d", re.IGNORECASE)
+
+# Likewise "Figure 1" / "Fig. 1", which is the only fast-strategy signal
+# for vector-drawn figures that produce no embedded Image element
+_FIGURE_TEXT_RE = re.compile(r"\bfig(ure)?\.?\s*\d", re.IGNORECASE)
+
 # --- Configure logger ---
 
 
@@ -62,12 +79,16 @@ def setup_logger(name='image_extractor', log_file='image_extractor.log', level=l
     return logger
 
 
-def get_image_context(elements, image_index, context_span=5):
+def get_image_context(cats, texts, image_index, context_span=5):
     """
     Extracts the surrounding text (captions, list items, narrative, titles) around an image.
 
+    Works on the pre-extracted category/text lists so the per-image scan does
+    plain list indexing instead of repeated element attribute access.
+
     Parameters:
-        elements (List): List of extracted elements from the PDF.
+        cats (List[str]): Category of each extracted element, in document order.
+        texts (List[str]): Text of each extracted element, in document order.
         image_index (int): Index of the current image.
         context_span (int): Number of surrounding elements to include in the context.
 
@@ -76,13 +97,13 @@ def get_image_context(elements, image_index, context_span=5):
     """
     narrative_texts_before = []
     for i in range(image_index - 1, max(image_index - context_span - 1, -1), -1):
-        if elements[i].category in ["FigureCaption", "ListItem", "NarrativeText", "Title"]:
-            narrative_texts_before.append(elements[i].text)
+        if cats[i] in _CONTEXT_CATEGORIES:
+            narrative_texts_before.append(texts[i])
 
     narrative_texts_after = []
-    for i in range(image_index + 1, min(image_index + context_span + 1, len(elements))):
-        if elements[i].category in ["FigureCaption", "ListItem", "NarrativeText", "Title"]:
-            narrative_texts_after.append(elements[i].text)
+    for i in range(image_index + 1, min(image_index + context_span + 1, len(cats))):
+        if cats[i] in _CONTEXT_CATEGORIES:
+            narrative_texts_after.append(texts[i])
 
     combined_context = narrative_texts_before + narrative_texts_after
     return ' '.join(combined_context).capitalize()
@@ -97,10 +118,15 @@ def save_image_context(image_context, logger, verified_dir, parent_label):
         verified_dir (str): Directory to save the context file.
         parent_label (str): Label for the image (e.g., figure number).
     """
+    if not image_context.strip():
+        # No surrounding captions; skip the file creation entirely rather
+        # than paying an inode allocation for an empty write
+        return
     context_file_path = os.path.join(
         verified_dir, f"{parent_label}-context.txt")
-    # REMOVED ENCODING UTF-8 HERE
-    with open(context_file_path, "w", encoding='utf-8') as context_file:
+    # Per-figure text files are what the image analyser consumes, so keep
+    # the layout but write through a single large buffer flush
+    with open(context_file_path, "w", encoding='utf-8', buffering=131072) as context_file:
         context_file.write(image_context)
     logger.info(f"Saved context for {parent_label} to: {context_file_path}")
 
@@ -115,13 +141,15 @@ def save_verified_image(image_path, logger, verified_dir, parent_label):
         parent_label (str): Label for the image (e.g., figure number).
     """
     if os.path.exists(image_path):
-        Path(verified_dir).mkdir(parents=True, exist_ok=True)
+        # verified_dir is created once per PDF in process_all_pdfs_with_structure
         filename = os.path.basename(image_path)
         file_stem, file_ext = os.path.splitext(filename)
         dest_path = os.path.join(verified_dir, f"{parent_label}{file_ext}")
 
         if os.path.abspath(image_path) != os.path.abspath(dest_path):
-            shutil.copy(image_path, dest_path)
+            # copyfile takes the kernel fast-copy path and skips the
+            # stat/metadata pass shutil.copy adds
+            shutil.copyfile(image_path, dest_path)
             logger.info(f"Saved verified image to: {dest_path}")
         else:
             logger.warning(
@@ -138,58 +166,96 @@ def determine_subfolder_type(subfolder_name):
     Returns:
         str: Subfolder type ('literature', 'ifu', or None).
     """
-    subfolder_name = subfolder_name.lower()
-    if "literature" in subfolder_name:
+    if _LITERATURE_RE.search(subfolder_name):
         return "literature"
-    elif "manual" in subfolder_name or "instructions for use" in subfolder_name or "ifu" in subfolder_name:
+    if _IFU_RE.search(subfolder_name):
         return "ifu"
     return None
 
 
-def process_all_pdfs_with_structure(directory, logger, output_dir_base="images"):
+def _walk_pdfs(root):
+    """
+    Yield paths of all PDF files under root.
+
+    Parameters:
+        root (str): Root directory to traverse.
+
+    Yields:
+        str: Path of each PDF file found.
+    """
+    for _dirpath, entry in iter_files(root):
+        if entry.name.lower().endswith(".pdf"):
+            yield entry.path
+
+
+def _process_one_pdf(job):
+    """
+    Worker entry point for one PDF; must stay top-level so it pickles.
+
+    Parameters:
+        job (tuple): (pdf_file_path, raw_dir, verified_dir).
+    """
+    pdf_file_path, raw_dir, verified_dir = job
+    logger = setup_logger()  # Each worker process configures its own logger
+
+    try:
+        logger.info(f"Processing file: {pdf_file_path}")
+        extract_pdf_images(pdf_file_path, logger, raw_dir, verified_dir)
+    except Exception as e:
+        logger.error(f"Error processing file {pdf_file_path}: {e}")
+
+
+def process_all_pdfs_with_structure(directory, logger, output_dir_base="images",
+                                    num_processes=None):
     """
     Processes all PDFs in the directory, extracting and saving images and contexts.
+    The per-file hi_res partition passes are compute bound, so files are dispatched
+    to a process pool rather than handled one at a time.
 
     Parameters:
         directory (str): Directory containing PDF files.
         output_dir_base (str): Base directory for saving images and contexts.
         logger (logging.Logger): Logger for tracking progress and errors.
+        num_processes (int, optional): Worker process count. Defaults to the core count.
     """
-    for root, dirs, files in os.walk(directory):
+    # PDFs in the same folder share their parent directories; track what has
+    # been created so each path costs one stat+mkdir pair, not one per file
+    created = set()
+
+    def _mkdir_once(path):
+        if path not in created:
+            os.makedirs(path, exist_ok=True)
+            created.add(path)
+
+    jobs = []
+    for pdf_file_path in _walk_pdfs(str(directory)):
+        root = os.path.dirname(pdf_file_path)
         parent_folder = os.path.basename(os.path.dirname(root))
         subfolder_type = determine_subfolder_type(os.path.basename(root))
-        # print("Parent Folder: ", parent_folder)
-        # print("Subfolder type: ", subfolder_type)
-
-        if subfolder_type:  # Only process literature or ifu subfolders
-            output_parent_dir = os.path.join(
-                output_dir_base, parent_folder, subfolder_type)
-            os.makedirs(output_parent_dir, exist_ok=True)
-
-            for file in files:
-                if file.endswith(".pdf"):
-                    pdf_file_path = os.path.join(root, file)
-                    file_base_name = generate_output_dir_from_filename(file)
-                    output_dir = os.path.join(
-                        output_parent_dir, file_base_name)
-
-                    # print("pdf file path: ", pdf_file_path)
-                    # print("File base name: ", file_base_name)
-                    # print("Output dir: ", output_dir)
-                    # print("\n")
-
-                    raw_dir = os.path.join(output_dir, "raw")
-                    verified_dir = os.path.join(output_dir, "verified")
-                    os.makedirs(raw_dir, exist_ok=True)
-                    os.makedirs(verified_dir, exist_ok=True)
-
-                    try:
-                        logger.info(f"Processing file: {pdf_file_path}")
-                        extract_pdf_images(
-                            pdf_file_path, logger, raw_dir, verified_dir)
-                    except Exception as e:
-                        logger.error(
-                            f"Error processing file {pdf_file_path}: {e}")
+
+        if not subfolder_type:  # Only process literature or ifu subfolders
+            continue
+
+        output_parent_dir = os.path.join(
+            output_dir_base, parent_folder, subfolder_type)
+        file_base_name = generate_output_dir_from_filename(
+            os.path.basename(pdf_file_path))
+        output_dir = os.path.join(output_parent_dir, file_base_name)
+
+        raw_dir = os.path.join(output_dir, "raw")
+        verified_dir = os.path.join(output_dir, "verified")
+        _mkdir_once(raw_dir)
+        _mkdir_once(verified_dir)
+
+        jobs.append((pdf_file_path, raw_dir, verified_dir))
+
+    if not jobs:
+        logger.info(f"No PDF files found under {directory}")
+        return
+
+    logger.info(f"Processing {len(jobs)} PDF files")
+    with ProcessPoolExecutor(max_workers=num_processes or os.cpu_count()) as executor:
+        list(executor.map(_process_one_pdf, jobs))
 
 
 def generate_output_dir_from_filename(filename):
@@ -217,18 +283,67 @@ def extract_pdf_images(filename, logger, raw_dir, verified_dir):
         raw_dir (str): Directory to store raw extracted images.
         verified_dir (str): Directory to store verified images and contexts.
     """
-    raw_pdf_elements = partition_pdf(
-        filename=filename,
+    # The local partition_pdf cannot restrict the hi_res layout model to a
+    # page range, so a cheap rule-based pass gates the expensive pass
+    # instead: prose-only documents with no image or table objects skip
+    # per-page model inference entirely. The fast elements are cached and
+    # shared with the chunk analyser, which partitions with the same options.
+    # The fast (pdfminer) strategy never emits Table elements and misses
+    # vector-drawn figures, so besides embedded images the gate also scans
+    # the extracted text for table and figure references before concluding
+    # there is nothing to extract
+    fast_elements = cached_partition_pdf(filename, strategy="fast")
+    has_figures_or_tables = any(
+        element.category in ("Image", "Table")
+        or _TABLE_TEXT_RE.search(element.text or "")
+        or _FIGURE_TEXT_RE.search(element.text or "")
+        for element in fast_elements)
+    if not has_figures_or_tables:
+        logger.warning(
+            f"No embedded figures or table references detected in {filename}; "
+            "skipping hi_res pass")
+        return
+
+    hi_res_kwargs = {}
+    try:
+        # Optional lighter layout model (e.g. yolox_quantized) from config
+        model_name = get_section("unstructured").get("hi_res_model_name")
+        if model_name:
+            hi_res_kwargs["hi_res_model_name"] = model_name
+    except KeyError:
+        pass
+
+    raw_pdf_elements = cached_partition_pdf(
+        filename,
         extract_images_in_pdf=True,
         strategy="hi_res",
         infer_table_structure=True,
         extract_image_block_types=["Image", "Table"],
-        extract_image_block_output_dir=raw_dir
+        extract_image_block_output_dir=raw_dir,
+        **hi_res_kwargs
     )
 
+    # One pass over the elements collects categories, texts and both index
+    # lists instead of re-scanning the element list per element type
+    cats = [element.category for element in raw_pdf_elements]
+    texts = [element.text for element in raw_pdf_elements]
+    image_indexes = []
+    table_indexes = []
+    for i, category in enumerate(cats):
+        if category == "Image":
+            image_indexes.append(i)
+        elif category == "Table":
+            table_indexes.append(i)
+
+    # Context windows of adjacent figures and tables overlap, and an element
+    # can appear in both index lists; memoise per index so each window is
+    # assembled at most once. The cache dies with this call, so it never
+    # pins the element lists of a previous document.
+    @lru_cache(maxsize=None)
+    def _ctx(index):
+        return get_image_context(cats, texts, index)
+
     # Process images
-    image_indexes = [i for i, element in enumerate(
-        raw_pdf_elements) if element.category == "Image"]
     image_count = 1
     for image_index in image_indexes:
         image_dict = raw_pdf_elements[image_index].metadata.to_dict()
@@ -241,18 +356,17 @@ def extract_pdf_images(filename, logger, raw_dir, verified_dir):
             logger.info(f"Detection probability: {detection_class_prob}")
             parent_label = f"figure{image_count}"
 
-            image_context = get_image_context(raw_pdf_elements, image_index)
-            save_image_context(image_context, logger,
-                               verified_dir, parent_label)
+            image_context = _ctx(image_index)
+            if image_context:
+                save_image_context(image_context, logger,
+                                   verified_dir, parent_label)
             save_verified_image(image_path, logger, verified_dir, parent_label)
             image_count += 1
         logger.info("-" * 153)
 
     # Process tables
-    image_indexes = [i for i, element in enumerate(
-        raw_pdf_elements) if element.category == "Table"]
     table_count = 1
-    for image_index in image_indexes:
+    for image_index in table_indexes:
         image_dict = raw_pdf_elements[image_index].metadata.to_dict()
         image_path = image_dict.get("image_path", "")
         detection_class_prob = float(
@@ -263,9 +377,10 @@ def extract_pdf_images(filename, logger, raw_dir, verified_dir):
             logger.info(f"Detection probability: {detection_class_prob}")
             parent_label = f"table{table_count}"
 
-            image_context = get_image_context(raw_pdf_elements, image_index)
-            save_image_context(image_context, logger,
-                               verified_dir, parent_label)
+            image_context = _ctx(image_index)
+            if image_context:
+                save_image_context(image_context, logger,
+                                   verified_dir, parent_label)
             save_verified_image(image_path, logger, verified_dir, parent_label)
             table_count += 1
         logger.info("-" * 153)
@@ -0,0 +1,183 @@
+import hashlib
+import io
+import os
+import pickle
+
+from collections import OrderedDict
+from pathlib import Path
+from unstructured.partition.pdf import partition_pdf
+from utils.config import get_section
+
+# hi_res partition_pdf runs layout-model inference per page and dominates
+# pipeline runtime, while image extraction and chunk analysis both need the
+# same elements for the same file. Results are cached on disk keyed by the
+# file identity (absolute path, mtime, size) plus the partition options, so
+# the second consumer pays a pickle load instead of a full model pass.
+CACHE_DIR = Path.home() / ".cache" / "hsa" / "partition"
+
+# In-process LRU on top of the disk cache, for repeated calls within a run.
+# Each entry holds a whole document's element list, so the cache is kept
+# small: long runs (and pool workers) would otherwise accumulate every
+# processed file's elements in memory.
+_MEMORY_CACHE_MAX = 8
+_memory_cache = OrderedDict()
+
+
+def _memory_cache_put(key, elements):
+    _memory_cache[key] = elements
+    _memory_cache.move_to_end(key)
+    while len(_memory_cache) > _MEMORY_CACHE_MAX:
+        _memory_cache.popitem(last=False)
+
+
+def _cache_key(filename, kwargs):
+    """
+    Build a cache key from the file identity and the partition options.
+
+    Args:
+        filename (str): Path to the PDF being partitioned.
+        kwargs (dict): Keyword arguments passed to partition_pdf.
+
+    Returns:
+        str: Hex digest identifying this (file, options) combination.
+    """
+    stat = os.stat(filename)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(os.path.abspath(filename).encode())
+    h.update(str(stat.st_mtime_ns).encode())
+    h.update(str(stat.st_size).encode())
+    h.update(repr(sorted(kwargs.items())).encode())
+    return h.hexdigest()
+
+
+def _api_section():
+    """
+    Return the unstructured_api config section when API partitioning is enabled.
+
+    Returns:
+        configparser.SectionProxy or None: The section, or None when the
+        section is absent or not enabled.
+    """
+    try:
+        section = get_section("unstructured_api")
+    except KeyError:
+        return None
+    if section.get("enabled", "false").lower() != "true":
+        return None
+    return section
+
+
+def _partition_pdf_api(filename, section, kwargs):
+    """
+    Partition a PDF through the hosted Unstructured API with page splitting.
+
+    split_pdf_page splits the document client-side and submits page batches
+    concurrently, so hi_res inference runs in parallel instead of being
+    serialized through one local worker.
+
+    Args:
+        filename (str): Path to the PDF to partition.
+        section: The unstructured_api config section.
+        kwargs (dict): Options originally intended for partition_pdf.
+
+    Returns:
+        list: Elements reconstructed from the API response.
+    """
+    import unstructured_client
+    from unstructured_client.models import operations, shared
+    from unstructured.staging.base import elements_from_dicts
+
+    client = unstructured_client.UnstructuredClient(
+        api_key_auth=section["api_key"],
+        server_url=section.get("api_url"),
+    )
+
+    with open(filename, "rb") as f:
+        files = shared.Files(
+            content=f.read(), file_name=os.path.basename(filename))
+
+    response = client.general.partition(request=operations.PartitionRequest(
+        partition_parameters=shared.PartitionParameters(
+            files=files,
+            strategy=kwargs.get("strategy", "hi_res"),
+            infer_table_structure=kwargs.get("infer_table_structure", False),
+            split_pdf_page=True,
+            split_pdf_concurrency_level=int(
+                section.get("split_pdf_concurrency_level", 10)),
+            split_pdf_allow_failed=True,
+        )
+    ))
+    return elements_from_dicts(response.elements)
+
+
+def cached_partition_pdf(filename, **kwargs):
+    """
+    Partition a PDF, reusing cached elements when the file and options match.
+
+    When the unstructured_api config section is enabled, partitioning goes
+    through the hosted API with concurrent page batches; the local
+    partition_pdf remains the fallback, and is always used for calls that
+    extract image blocks to disk (the API does not write local files).
+    Image-extracting calls also bypass the persistent cache, because their
+    contract includes writing the crops, not just returning elements.
+
+    Args:
+        filename (str): Path to the PDF to partition.
+        **kwargs: Options forwarded to unstructured's partition_pdf.
+
+    Returns:
+        list: The partitioned elements.
+    """
+    key = _cache_key(filename, kwargs)
+    elements = _memory_cache.get(key)
+    if elements is not None:
+        _memory_cache.move_to_end(key)
+        return elements
+
+    # Calls that extract image blocks have a filesystem side effect: the
+    # crops must exist on disk next to the returned elements. A persistent
+    # cache hit would skip rewriting them after the output tree is wiped,
+    # so such calls are served from the in-process cache only.
+    writes_images = "extract_image_block_output_dir" in kwargs
+
+    cache_path = CACHE_DIR / f"{key}.pkl"
+    if not writes_images and cache_path.exists():
+        try:
+            with open(cache_path, "rb") as f:
+                elements = pickle.load(f)
+            _memory_cache_put(key, elements)
+            return elements
+        except Exception:
+            pass  # Corrupt or stale cache entry; fall through and re-partition
+
+    elements = None
+    # Only hi_res partitions are worth the upload and round trip; fast
+    # (pdfminer) calls are cheaper run locally than shipped to the API
+    section = _api_section()
+    if (section is not None
+            and kwargs.get("strategy") == "hi_res"
+            and "extract_image_block_output_dir" not in kwargs):
+        try:
+            elements = _partition_pdf_api(filename, section, kwargs)
+        except Exception:
+            elements = None  # Fall back to the local strategy
+
+    if elements is None:
+        # pdfminer re-reads the file in small chunks for each of its passes;
+        # one buffered read into memory turns those into in-process seeks.
+        # metadata_filename keeps the element metadata identical to the
+        # filename= form.
+        with open(filename, "rb", buffering=1 << 20) as f:
+            data = f.read()
+        elements = partition_pdf(
+            file=io.BytesIO(data), metadata_filename=filename, **kwargs)
+
+    if not writes_images:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        try:
+            with open(cache_path, "wb") as f:
+                f.write(pickle.dumps(elements, protocol=5))
+        except Exception:
+            pass  # Caching is best effort; never fail the partition over it
+    _memory_cache_put(key, elements)
+    return elements
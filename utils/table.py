@@ -14,21 +14,25 @@ class AzureTableClient:
         self.credential = AzureNamedKeyCredential(account_name, account_key)
         self.table_service_client = TableServiceClient(
             endpoint=self.endpoint, credential=self.credential)
+        # One TableClient per table; building a client sets up a fresh HTTP
+        # pipeline and auth handlers, so it should not happen per call
+        self._table_clients = {}
         self.logger = self.configure_logger()
 
     def configure_logger(self):
         logger = logging.getLogger(__name__)
-        logger.setLevel(logging.INFO)
-        handler = logging.StreamHandler()
-        formatter = logging.Formatter(
-            "%(asctime)s - %(levelname)s - %(message)s")
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
+        if not logger.handlers:  # Avoid duplicate handlers
+            logger.setLevel(logging.INFO)
+            handler = logging.StreamHandler()
+            formatter = logging.Formatter(
+                "%(asctime)s - %(levelname)s - %(message)s")
+            handler.setFormatter(formatter)
+            logger.addHandler(handler)
         return logger
 
     def get_table_client(self, table_name):
         """
-        Retrieve the Azure Table client for a specific table.
+        Retrieve the Azure Table client for a specific table, cached per table.
 
         Args:
             table_name (str): The name of the Azure Table.
@@ -36,7 +40,12 @@ class AzureTableClient:
         Returns:
             TableClient: An instance of the Azure Table client for the specified table.
         """
-        return self.table_service_client.get_table_client(table_name)
+        client = self._table_clients.get(table_name)
+        if client is None:
+            client = self._table_clients.setdefault(
+                table_name,
+                self.table_service_client.get_table_client(table_name))
+        return client
 
     def create_table_if_not_exists(self, table_name):
         """
@@ -62,8 +71,9 @@ class AzureTableClient:
         """
         Check if a table exists in Azure Table Storage.
 
-        This method attempts to query entities from the specified table to check its existence.
-        If the table exists, it returns True; otherwise, it returns False.
+        This method queries the table metadata by name, which is a single
+        management call instead of a data-plane entity query, and is correct
+        even when the table has empty partitions.
 
         Args:
             table_name (str): The name of the Azure Table to check.
@@ -72,10 +82,9 @@ class AzureTableClient:
             bool: True if the table exists, False otherwise.
         """
         try:
-            table_client = self.get_table_client(table_name)
-            table_client.list_entities(
-                query_filter="PartitionKey eq ''", select='PartitionKey')
-            return True
+            tables = self.table_service_client.query_tables(
+                f"TableName eq '{table_name}'")
+            return any(table.name == table_name for table in tables)
         except Exception:
             return False
 
@@ -127,15 +136,29 @@ class AzureTableClient:
         try:
             table_client = self.get_table_client(table_name)
 
-            # Start searching from the beginning of the partition
+            # Push the predicate to the server so only the matching row is
+            # transferred instead of paging through the whole partition.
+            # Doc names come from arbitrary filenames, so single quotes must
+            # be doubled per OData before interpolation
+            safe_project_name = project_name.replace("'", "''")
+            safe_doc_name = doc_name.lower().replace("'", "''")
+            filter_query = (
+                f"PartitionKey eq '{safe_project_name}' and "
+                f"doc_name_lower eq '{safe_doc_name}'")
+            entities = table_client.query_entities(
+                query_filter=filter_query, select='RowKey')
+            entity = next(iter(entities), None)
+            if entity is not None:
+                # Return the RowKey which contains the hashed_doc_name
+                return entity['RowKey']
+
+            # Legacy entities inserted before doc_name_lower existed still
+            # need the old partition scan
             filter_query = f"PartitionKey eq '{project_name}' and RowKey ge ''"
-
-            # Limit the results to a reasonable number
             retrieved_entities = self.get_entities(table_client, filter_query)
 
             for entity in retrieved_entities:
                 if entity.get('doc_name', '').lower() == doc_name.lower():
-                    # Return the RowKey which contains the hashed_doc_name
                     return entity['RowKey']
 
             return None
@@ -182,11 +205,46 @@ class AzureTableClient:
             'project_name': project_name,
             'hashed_doc_name': hashed_doc_name,
             'doc_name': doc_name,
+            # Lowercased copy so retrieve_by_doc_name can filter server-side
+            'doc_name_lower': doc_name.lower(),
             'description': "This is a document mapper for hashed documents"
         }
 
         self.insert_entity(table_client, entity)
 
+    def insert_many(self, table_name, entities):
+        """
+        Insert entities in transactional batches instead of one call each.
+
+        Entities are grouped by PartitionKey (a transaction must stay within
+        one partition) and submitted in batches of up to 100, the service
+        limit. Upsert mode keeps bulk inserts idempotent, so re-running an
+        ingestion does not fail the whole batch on an existing row.
+
+        Args:
+            table_name (str): The name of the Azure Table.
+            entities (list): Entity dicts, each with PartitionKey and RowKey.
+
+        Logs:
+            Success or failure of each submitted batch.
+        """
+        table_client = self.get_table_client(table_name)
+
+        groups = {}
+        for entity in entities:
+            groups.setdefault(entity['PartitionKey'], []).append(entity)
+
+        for group in groups.values():
+            for start in range(0, len(group), 100):
+                batch = [("upsert", entity)
+                         for entity in group[start:start + 100]]
+                try:
+                    table_client.submit_transaction(batch)
+                    self.logger.info(
+                        f"Inserted batch of {len(batch)} entities into '{table_name}'")
+                except Exception as e:
+                    self.logger.error(f"Error inserting batch: {e}")
+
     def insert_with_schema(self, table_name, schema_dict):
         """
         Generic method to insert an entity into a table based on a given schema.
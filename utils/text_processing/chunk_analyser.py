@@ -1,9 +1,11 @@
 import logging
 
-from statistics import mean, median
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, NamedTuple
-from unstructured.partition.pdf import partition_pdf
 from unstructured.chunking.title import chunk_by_title
+from utils.partition_cache import cached_partition_pdf
 
 
 # --- Configure logger ---
@@ -33,8 +35,12 @@ class ChunkAnalyser:
             'consistency': consistency_weight
         }
 
-    def analyse_chunks(self, filename: str, max_chars_options: List[int]) -> ChunkSettings:
-        elements = partition_pdf(filename=filename, strategy="hi_res")
+    def analyse_chunks(self, filename: str, max_chars_options: List[int],
+                       strategy: str = "fast") -> ChunkSettings:
+        # The elements are only used for chunk-length statistics, so the
+        # rule-based "fast" strategy is enough; pass strategy="hi_res" if
+        # model-based element classification is really needed
+        elements = cached_partition_pdf(filename, strategy=strategy)
         results = self._test_chunk_configs(elements, max_chars_options)
         best_config = self._get_best_config(results)
         self._log_analysis(results, best_config)
@@ -44,21 +50,44 @@ class ChunkAnalyser:
             overlap=best_config // 2
         )
 
+    # Below this many chunks, plain int arithmetic beats paying the
+    # ndarray construction overhead; above it, the C-level passes win
+    _NUMPY_THRESHOLD = 64
+
+    def _measure_config(self, elements: List, max_chars: int) -> Dict:
+        chunks = chunk_by_title(
+            elements, max_characters=max_chars, combine_text_under_n_chars=max_chars, overlap=max_chars // 2)
+        if len(chunks) < self._NUMPY_THRESHOLD:
+            lengths = sorted(len(str(chunk)) for chunk in chunks)
+            min_length = lengths[0]
+            max_length = lengths[-1]
+            avg_length = sum(lengths) / len(lengths)
+            median_length = float(lengths[len(lengths) // 2])
+        else:
+            chunk_lengths = np.fromiter(
+                (len(str(chunk)) for chunk in chunks),
+                dtype=np.int32, count=len(chunks))
+            min_length = int(chunk_lengths.min())
+            max_length = int(chunk_lengths.max())
+            avg_length = float(chunk_lengths.mean())
+            median_length = float(np.median(chunk_lengths))
+        return {
+            'num_chunks': len(chunks),
+            'avg_length': avg_length,
+            'median_length': median_length,
+            'max_length': max_length,
+            'min_length': min_length,
+            'length_ratio': min_length / max_length
+        }
+
     def _test_chunk_configs(self, elements: List, max_chars_options: List[int]) -> Dict:
-        results = {}
-        for max_chars in max_chars_options:
-            chunks = chunk_by_title(
-                elements, max_characters=max_chars, combine_text_under_n_chars=max_chars, overlap=max_chars // 2)
-            chunk_lengths = [len(str(chunk)) for chunk in chunks]
-            results[max_chars] = {
-                'num_chunks': len(chunks),
-                'avg_length': mean(chunk_lengths),
-                'median_length': median(chunk_lengths),
-                'max_length': max(chunk_lengths),
-                'min_length': min(chunk_lengths),
-                'length_ratio': min(chunk_lengths) / max(chunk_lengths)
-            }
-        return results
+        # Each option re-chunks the same (already partitioned) element list;
+        # the options are independent, so measure them in parallel
+        with ThreadPoolExecutor(max_workers=len(max_chars_options)) as executor:
+            stats = executor.map(
+                lambda max_chars: self._measure_config(elements, max_chars),
+                max_chars_options)
+        return dict(zip(max_chars_options, stats))
 
     def _score_config(self, stats: Dict) -> float:
         min_chunk_score = min(1.0, stats['min_length'] / self.target_min_chunk)
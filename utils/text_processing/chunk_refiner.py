@@ -1,49 +1,143 @@
+import aiofiles
+import asyncio
+import csv
+import hashlib
+import json
 import os
 import logging
-import time
-import configparser
+import re
 
-from alive_progress import alive_bar
-from azure.data.tables import TableServiceClient
-from azure.core.credentials import AzureNamedKeyCredential
+from tqdm import tqdm
 from langchain_community.callbacks import get_openai_callback
 from langchain_openai import AzureChatOpenAI
 from langchain.prompts import ChatPromptTemplate
-from langchain.chains import LLMChain
+from functools import lru_cache
+from langchain_core.output_parsers import StrOutputParser
+from pathlib import Path
 from tiktoken import encoding_for_model
-from typing import List, Dict
+from typing import List, Dict, Optional
+from utils.config import get_section
 from utils.table import azure_table_client
-import pandas as pd
-from openpyxl import load_workbook, Workbook
 
 # --- Configure logger ---
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
-handler = logging.StreamHandler()
-formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-handler.setFormatter(formatter)
-logger.addHandler(handler)
-
-# Load configuration
-config = configparser.ConfigParser()
-config.read("config.prop")
-
-# --- Azure table ---
-azure_hsa_store_config = config["azure_hsa_store"]
-account_name = azure_hsa_store_config["account_name"]
-account_key = azure_hsa_store_config["account_key"]
-
-credential = AzureNamedKeyCredential(account_name, account_key)
-endpoint = f"https://{account_name}.table.core.windows.net"
-
-table_service_client = TableServiceClient(endpoint=endpoint, credential=credential)
-table_name = "docmap"
-
-azure_config = config["azure_openai_gpt4o-mini"]
-
-# Set environment variables
-os.environ["AZURE_OPENAI_ENDPOINT"] = azure_config["endpoint"]
-os.environ["AZURE_OPENAI_API_KEY"] = azure_config["api_key"]
+if not logger.handlers:  # Avoid duplicate handlers on re-import
+    handler = logging.StreamHandler()
+    formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+
+
+@lru_cache(maxsize=1)
+def _init_azure_env():
+    """
+    Point the process at the Azure OpenAI deployment, once.
+
+    The environment setup used to run at import time, re-reading config.prop
+    and mutating os.environ in every process that imported this module;
+    deferring it to first ChunkRefiner construction keeps imports (and
+    multiprocessing worker spawns) side-effect free.
+    """
+    azure_config = get_section("azure_openai_gpt4o-mini")
+    os.environ["AZURE_OPENAI_ENDPOINT"] = azure_config["endpoint"]
+    os.environ["AZURE_OPENAI_API_KEY"] = azure_config["api_key"]
+
+
+# Process-wide cap on concurrent in-flight refinement calls; the per-call
+# latency is dominated by the Azure OpenAI round trip, so overlapping
+# requests up to the deployment's rate limit is where the speedup comes
+# from. arefine_many splits this budget between its documents so running
+# several at once never exceeds it
+MAX_LLM_CONCURRENCY = 8
+
+# Documents refined concurrently by arefine_many; each document's Azure
+# Table metadata fetch and short-chunk handling then hides behind other
+# documents' LLM work
+MAX_CONCURRENT_DOCS = 4
+
+# Section extraction in one C-level pass instead of a per-line Python loop
+_SECTION_RE = re.compile(
+    r'\[SECTION_START\]\s*(.*?)\s*\[SECTION_END\]', re.DOTALL)
+
+# Identical chunks — boilerplate headers, tables of contents, standard
+# warnings — recur across documents and across reruns after a failure.
+# Refined sections are cached on disk keyed by the chunk content plus the
+# settings that shape the output, so a repeat chunk costs a JSON load
+# instead of an LLM call. Same layout as the partition cache in
+# utils.partition_cache.
+_CHUNK_CACHE_DIR = Path.home() / ".cache" / "hsa" / "refined_chunks"
+
+# Bump whenever the refinement prompt or its output contract changes, so
+# entries produced by older prompts are never served
+_PROMPT_REVISION = 2
+
+
+def _chunk_cache_path(chunk_text: str, max_tokens: int) -> Path:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(chunk_text.encode())
+    h.update(f"{_PROMPT_REVISION}:{max_tokens}".encode())
+    return _CHUNK_CACHE_DIR / f"{h.hexdigest()}.json"
+
+
+@lru_cache(maxsize=4)
+def _get_tokenizer(model: str = "gpt-4o"):
+    """
+    Return the tiktoken encoding for a model, loaded once per process.
+
+    encoding_for_model builds the BPE merge tables on every call, so all
+    ChunkRefiner instances (and worker processes importing this module)
+    share a single cached load.
+    """
+    return encoding_for_model(model)
+
+
+@lru_cache(maxsize=4096)
+def _count_tokens(model: str, text: str) -> int:
+    """
+    Count tokens in text, memoised on the text itself.
+
+    Retries re-encode the same chunk and boilerplate sections (headers,
+    standard warnings) repeat across documents, so caching by content skips
+    the redundant BPE encodes.
+    """
+    return len(_get_tokenizer(model).encode(text))
+
+
+@lru_cache(maxsize=64)
+def _docmap_for_project(project_name: str) -> Dict[str, str]:
+    """
+    Fetch the full docmap partition for a project in one query.
+
+    One Azure Table round trip per document adds up quickly; a single
+    partition-key query pulls every doc_name -> hashed_doc_name mapping for
+    the project, and get_document_metadata is then a dict lookup.
+
+    Returns:
+        Dict mapping lowercased doc_name to its hashed RowKey.
+    """
+    table_client = azure_table_client.get_table_client("docmap")
+    # Double single quotes per OData so project names with apostrophes
+    # don't break the filter
+    safe_project_name = project_name.replace("'", "''")
+    entities = table_client.query_entities(
+        query_filter=f"PartitionKey eq '{safe_project_name}'")
+    return {
+        entity.get('doc_name', '').lower(): entity['RowKey']
+        for entity in entities
+    }
+
+
+async def _awrite_section(path, content):
+    """
+    Write one section file without blocking the event loop.
+
+    A plain open/write inside the async pipeline would stall every in-flight
+    Azure request for the duration of the syscall; aiofiles pushes the write
+    to its thread pool so it interleaves with pending LLM responses.
+    """
+    async with aiofiles.open(path, "w", encoding="utf-8") as f:
+        await f.write(content)
 
 
 class ChunkRefiner:
@@ -51,16 +145,24 @@ class ChunkRefiner:
                  temperature: float = 0.0, max_retries: int = 3, retry_delay: int = 2,
                  max_tokens_per_section: int = 800, min_tokens_per_section: int = 50):
 
+        _init_azure_env()
         self.llm = AzureChatOpenAI(
             azure_deployment=deployment_name,
             api_version=api_version,
-            temperature=temperature
+            temperature=temperature,
+            # Constrained JSON output parses reliably, so marker drift no
+            # longer burns a full-cost retry
+            model_kwargs={"response_format": {"type": "json_object"}}
         )
-        self.tokenizer = encoding_for_model("gpt-4o")
+        self.tokenizer = _get_tokenizer("gpt-4o")
         self.max_retries = max_retries
         self.retry_delay = retry_delay
         self.max_tokens_per_section = max_tokens_per_section
         self.min_tokens_per_section = min_tokens_per_section
+        # Open CSV sinks for the chunk-comparison log, keyed by project;
+        # appending a row is then a buffered write rather than an xlsx
+        # parse/serialize cycle
+        self._comparison_files = {}
         self.prompt = ChatPromptTemplate.from_template(
             """You are a precise text refinement and sectioning assistant. Your task is ONLY to:
 
@@ -77,18 +179,22 @@ class ChunkRefiner:
             10. Ensure lossless splitting: Byte-level and character-level consistency must be maintained. Whitespace, tabs, indentation, and newline characters must remain untouched.
             11. The final output must be 100 percent identical to the input at a token, word, character, and formatting level, except for the section breaks.
 
-            Format each section as:
+            Respond with a JSON object of the form:
 
-            [SECTION_START]
-            <section content>
-            [SECTION_END]
+            {{"sections": ["<section 1 content>", "<section 2 content>", ...]}}
 
             Text chunk to refine and section:
             {chunk}
 
             Refined and sectioned text:"""
         )
-        self.chain = LLMChain(llm=self.llm, prompt=self.prompt)
+        # max_tokens is fixed for the refiner's lifetime; binding it here
+        # leaves only {chunk} to substitute per call
+        self.prompt = self.prompt.partial(
+            max_tokens=str(self.max_tokens_per_section))
+        # LCEL pipeline: no LLMChain validation/dict-wrangling layer per
+        # call, and the string parser removes the output unwrap step
+        self.chain = self.prompt | self.llm | StrOutputParser()
 
     def get_document_metadata(self, filename: str, project_name: str, doc_name: str, subfolder_type: str) -> str:
         """
@@ -103,15 +209,10 @@ class ChunkRefiner:
             str: The refined filename suffix (hashed_doc_name-lr or hashed_doc_name-ifu).
         """
 
-        entity = azure_table_client.retrieve_by_doc_name(
-            table_name="docmap",
-            project_name=project_name,
-            doc_name=doc_name
-        )
-        if entity:
-            # Entity is found, assign hashed_doc
-            hashed_doc = entity
-        else:
+        # Served from the per-project prefetch; one partition query replaces
+        # one table round trip per document
+        hashed_doc = _docmap_for_project(project_name).get(doc_name.lower())
+        if not hashed_doc:
             # Handle the case where entity is not found, e.g., raise an exception or log the error
             raise ValueError(f"No matching entry found in Azure Table for {filename}")
 
@@ -120,66 +221,116 @@ class ChunkRefiner:
 
     def count_tokens(self, text: str) -> int:
         """Count tokens in text using tiktoken"""
-        return len(self.tokenizer.encode(text))
+        return _count_tokens("gpt-4o", text)
 
     def parse_sections(self, refined_text: str) -> List[str]:
         """Parse sections from refined text"""
-        sections = []
-        current_section = []
-
-        for line in refined_text.split('\n'):
-            if line.strip() == '[SECTION_START]':
-                current_section = []
-            elif line.strip() == '[SECTION_END]':
-                if current_section:
-                    sections.append('\n'.join(current_section).strip())
-            else:
-                current_section.append(line)
-
-        return sections
-
-    def refine_chunk(self, project_name: str, chunk: str, chunk_index: int, refined_filename_suffix: str,
-                     filename: str) -> List[Dict]:
-        """
-        Refine a single chunk into sections with retry logic.
+        return [section for section in _SECTION_RE.findall(refined_text)
+                if section]
 
-        Args:
-            chunk: Text chunk to refine.
-            chunk_index: Index of the chunk.
-            refined_filename_suffix: The suffix to append to each section filename.
-
-        Returns:
-            List of dictionaries containing refined sections and their metadata.
+    def _refine_local(self, project_name: str, chunk, chunk_text: str, chunk_index: int,
+                      refined_filename_suffix: str, filename: str):
         """
-        print("filename", filename)
+        Resolve a chunk without the LLM when possible.
 
-        refined_sections = []
-        for attempt in range(self.max_retries):
+        Covers the under-budget fast path and the on-disk refined-section
+        cache. Returns the section list when the chunk is resolved locally,
+        or None when it needs a refinement call.
+        """
+        logger.debug("filename=%s chunk=%s", filename, chunk_index)
+
+        # Fast path: a chunk already within the per-section budget needs no
+        # refinement; emit it as its own section and skip the round trip
+        chunk_tokens = self.count_tokens(chunk_text)
+        if chunk_tokens <= self.max_tokens_per_section:
+            if chunk_tokens <= self.min_tokens_per_section:
+                return []
+            self.save_comparison(project_name, filename, chunk, chunk_text, chunk_index)
+            return [{
+                'section_id': f"{project_name}-{refined_filename_suffix}-chunk{chunk_index}-section1",
+                'content': chunk_text,
+                'token_count': chunk_tokens
+            }]
+
+        # Refined-section cache: repeat chunks skip the LLM entirely
+        cache_path = _chunk_cache_path(
+            chunk_text, self.max_tokens_per_section)
+        if cache_path.exists():
             try:
-                refined = self.chain.run(chunk=chunk, max_tokens=self.max_tokens_per_section)
-
-                sections = self.parse_sections(refined.strip())
-                # added here
-                combined__refined_text = "\n\n".join(sections)
-                self.save_to_excel(project_name, filename, chunk, combined__refined_text, chunk_index)
-                for section_index, section in enumerate(sections, 1):
-                    section_id = f"{project_name}-{refined_filename_suffix}-chunk{chunk_index}-section{section_index}"
-                    token_count = self.count_tokens(section)
-                    if token_count > self.min_tokens_per_section:
-                        refined_sections.append({
-                            'section_id': section_id,
-                            'content': section,
-                            'token_count': token_count
-                        })
-                return refined_sections  # Return once successful
-            except Exception as e:
-                logger.error(f"Error refining chunk {chunk_index} on attempt {attempt + 1}/{self.max_retries}: {e}")
-                if attempt == self.max_retries - 1:
-                    logger.warning(f"Skipping chunk {chunk_index} after {self.max_retries} failed attempts.")
-        return refined_sections  # Return whatever sections were successfully refined (or empty if none)
+                with open(cache_path, encoding="utf-8") as f:
+                    cached_sections = json.load(f)["sections"]
+            except Exception:
+                cached_sections = None  # Corrupt entry; refine again
+            if cached_sections is not None:
+                combined = "\n\n".join(text for text, _ in cached_sections)
+                self.save_comparison(project_name, filename, chunk, combined, chunk_index)
+                return [
+                    {
+                        'section_id': f"{project_name}-{refined_filename_suffix}-chunk{chunk_index}-section{section_index}",
+                        'content': text,
+                        'token_count': count
+                    }
+                    for section_index, (text, count) in enumerate(cached_sections, 1)
+                    if count > self.min_tokens_per_section
+                ]
+
+        return None
+
+    def _postprocess_refined(self, refined: str, project_name: str, chunk, chunk_text: str,
+                             chunk_index: int, refined_filename_suffix: str, filename: str) -> Optional[List[Dict]]:
+        """
+        Turn a refined completion into section dicts and feed the caches.
 
-    def refine_chunks_and_save(self, chunks: List, filename: str, project_name: str, document_name: str,
-                               subfolder_type: str, output_dir="text_sections"):
+        Returns None when the completion could not be parsed into any
+        section, so the caller can retry instead of caching the failure.
+        """
+        try:
+            sections = [str(section)
+                        for section in json.loads(refined)["sections"]]
+        except (ValueError, KeyError, TypeError):
+            # Model drifted off the schema; fall back to the legacy marker
+            # convention before giving up on the chunk
+            sections = self.parse_sections(refined.strip())
+        if not sections:
+            return None
+
+        # added here
+        combined__refined_text = "\n\n".join(sections)
+        self.save_comparison(project_name, filename, chunk, combined__refined_text, chunk_index)
+
+        # encode_batch releases the GIL and encodes the sections in parallel
+        # in tiktoken's Rust layer, instead of one Python encode call per
+        # section
+        counts = self.tokenizer.encode_batch(sections, num_threads=os.cpu_count())
+        refined_sections = []
+        for section_index, (section, tokens) in enumerate(zip(sections, counts), 1):
+            section_id = f"{project_name}-{refined_filename_suffix}-chunk{chunk_index}-section{section_index}"
+            token_count = len(tokens)
+            if token_count > self.min_tokens_per_section:
+                refined_sections.append({
+                    'section_id': section_id,
+                    'content': section,
+                    'token_count': token_count
+                })
+
+        # Only successful parses reach this point, so an off-schema
+        # response never poisons the content-keyed cache
+        try:
+            _CHUNK_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            cache_path = _chunk_cache_path(
+                chunk_text, self.max_tokens_per_section)
+            with open(cache_path, "w", encoding="utf-8") as f:
+                json.dump({"sections": [
+                    [section, len(tokens)]
+                    for section, tokens in zip(sections, counts)]}, f)
+        except Exception:
+            pass  # Caching is best effort; never fail the chunk over it
+
+        return refined_sections
+
+    async def arefine_chunks_and_save(self, chunks: List, filename: str, project_name: str, document_name: str,
+                                      subfolder_type: str, output_dir="text_sections",
+                                      max_concurrency=MAX_LLM_CONCURRENCY):
         """
         Refine chunks into sections and save them with the new naming convention.
 
@@ -189,6 +340,7 @@ class ChunkRefiner:
             project_name: Name of the project (partition key for Azure Table).
             source_folder: Source folder name (determines if it's 'lr' or 'ifu').
             output_dir: Directory to save the refined sections.
+            max_concurrency: Cap on this document's in-flight LLM calls.
         """
         # Get document metadata
         logger.info(f"*** Refining chunks for: {document_name}")
@@ -198,69 +350,161 @@ class ChunkRefiner:
         logger.info(f"Starting refinement of {len(chunks)} chunks for file {filename}...")
 
         with get_openai_callback() as cb:
-            with alive_bar(len(chunks), title="Refining chunks") as bar:
-                for chunk_index, chunk in enumerate(chunks, 1):
-                    sections = self.refine_chunk(project_name, chunk, chunk_index, refined_filename_suffix, filename)
-                    for section in sections:
-                        section_filename = f"{section['section_id']}.txt"
-                        section_path = os.path.join(output_dir, section_filename)
-                        with open(section_path, "w", encoding="utf-8") as f:
-                            f.write(section['content'])
-                    bar()
+            await self._refine_all(
+                chunks, project_name, refined_filename_suffix, filename,
+                output_dir, max_concurrency)
 
+        self.flush_comparisons()
         logger.info(f"Refinement complete. All sections saved in {output_dir}")
 
-    def save_to_excel(self, project_name: str, filename: str, original_chunk: str, refined_chunk: str,
-                      chunk_index: int):
+    def refine_chunks_and_save(self, chunks: List, filename: str, project_name: str, document_name: str,
+                               subfolder_type: str, output_dir="text_sections"):
+        """Sync entry point for refining a single document."""
+        asyncio.run(self.arefine_chunks_and_save(
+            chunks, filename, project_name, document_name, subfolder_type, output_dir))
+
+    async def arefine_many(self, jobs: List, output_dir="text_sections"):
         """
-        Save original and refined chunks into an Excel file, appending to the next available row.
+        Refine several documents concurrently.
 
         Args:
-            project_name: Name of the project (used for the Excel filename).
-            filename: Name of the file (used for the sheet name).
+            jobs: Tuples of (chunks, filename, project_name, document_name,
+                subfolder_type), one per document.
+            output_dir: Directory to save the refined sections.
+        """
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOCS)
+        # Split the process-wide LLM budget across concurrent documents so
+        # the total stays at MAX_LLM_CONCURRENCY rather than multiplying
+        per_doc_concurrency = max(
+            1, MAX_LLM_CONCURRENCY // MAX_CONCURRENT_DOCS)
+
+        async def _bounded(job):
+            async with semaphore:
+                await self.arefine_chunks_and_save(
+                    *job, output_dir=output_dir,
+                    max_concurrency=per_doc_concurrency)
+
+        results = await asyncio.gather(
+            *(_bounded(job) for job in jobs), return_exceptions=True)
+        for job, result in zip(jobs, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error refining {job[1]}: {result}")
+
+    async def _refine_all(self, chunks: List, project_name: str, refined_filename_suffix: str,
+                          filename: str, output_dir: str,
+                          max_concurrency: int = MAX_LLM_CONCURRENCY) -> None:
+        """
+        Refine all chunks and write their sections as they land.
+
+        Locally resolvable chunks (fast path, cache hits) are handled first;
+        the rest go to the model through chain.abatch, which provides
+        rate-limited concurrency natively and keeps the token-usage callback
+        context intact. Failed chunks are re-batched up to max_retries
+        rounds. Section files are written with aiofiles so the writes
+        interleave with the responses still in flight.
+        """
+        async def _write(sections):
+            if sections:
+                await asyncio.gather(*(
+                    _awrite_section(
+                        os.path.join(output_dir, f"{section['section_id']}.txt"),
+                        section['content'])
+                    for section in sections))
+
+        # tqdm is far cheaper per update than alive_bar's animated
+        # renderer, which matters now that updates fire from many
+        # concurrent completions
+        with tqdm(total=len(chunks), desc="Refining chunks") as pbar:
+            pending = []
+            for chunk_index, chunk in enumerate(chunks, 1):
+                chunk_text = str(chunk)
+                sections = self._refine_local(
+                    project_name, chunk, chunk_text, chunk_index,
+                    refined_filename_suffix, filename)
+                if sections is None:
+                    pending.append((chunk, chunk_text, chunk_index))
+                else:
+                    await _write(sections)
+                    pbar.update(1)
+
+            for attempt in range(self.max_retries):
+                if not pending:
+                    break
+                inputs = [{"chunk": chunk} for chunk, _, _ in pending]
+                results = await self.chain.abatch(
+                    inputs,
+                    config={"max_concurrency": max_concurrency},
+                    return_exceptions=True)
+
+                still_pending = []
+                for (chunk, chunk_text, chunk_index), refined in zip(pending, results):
+                    sections = None
+                    if isinstance(refined, Exception):
+                        logger.error(
+                            f"Error refining chunk {chunk_index} on attempt {attempt + 1}/{self.max_retries}: {refined}")
+                    else:
+                        sections = self._postprocess_refined(
+                            refined, project_name, chunk, chunk_text, chunk_index,
+                            refined_filename_suffix, filename)
+                        if sections is None:
+                            logger.error(
+                                f"Unparseable response for chunk {chunk_index} on attempt {attempt + 1}/{self.max_retries}")
+
+                    # Unparseable responses retry alongside transport errors
+                    if sections is None:
+                        if attempt == self.max_retries - 1:
+                            logger.warning(
+                                f"Skipping chunk {chunk_index} after {self.max_retries} failed attempts.")
+                            pbar.update(1)
+                        else:
+                            still_pending.append((chunk, chunk_text, chunk_index))
+                        continue
+
+                    await _write(sections)
+                    pbar.update(1)
+                pending = still_pending
+
+    def save_comparison(self, project_name: str, filename: str, original_chunk: str, refined_chunk: str,
+                        chunk_index: int):
+        """
+        Append an original/refined chunk pair to the project's comparison CSV.
+
+        CSV is append-friendly: each row is one buffered write to a file
+        handle held open per project, where the previous xlsx sink reparsed
+        and reserialized the whole workbook per appended row.
+
+        Args:
+            project_name: Name of the project (used for the CSV filename).
+            filename: Name of the file the chunk came from.
             original_chunk: The original chunk before refinement.
             refined_chunk: The refined chunk.
+            chunk_index: Index of the chunk within the file.
         """
-        excel_filename = f"{project_name}_refined_chunks_comparison.xlsx"  # Different file for each project
         # Normalize path to handle backslashes and forward slashes
         normalized_filename = os.path.normpath(filename)
+        document = os.path.splitext(os.path.basename(normalized_filename))[0]
 
-        # Extract the last part (file name without extension)
-        last_part = os.path.splitext(os.path.basename(normalized_filename))[0]
-        sheet_name = last_part[:31]  # Excel sheet names have a 31-character limit
-        print("Filename:", filename)
-        print("Sheet name:", sheet_name)
-
-        # Append data properly to the next available row
-        self.append_to_next_row(excel_filename, sheet_name, str(original_chunk), refined_chunk)
-        print(f"Saved refined chunk to {excel_filename}, sheet: {sheet_name}")
-
-    def append_to_next_row(self, excel_filename, sheet_name, original_chunk, refined_chunk):
         try:
-            # Load the existing workbook
-            if os.path.exists(excel_filename):
-                wb = load_workbook(excel_filename)
-            else:
-                print(f"File '{excel_filename}' not found. Creating a new file.")
-                wb = Workbook()
-
-            # Check if sheet exists, create if not
-            if sheet_name not in wb.sheetnames:
-                ws = wb.create_sheet(sheet_name)
-                ws.append(["Original Chunk", "Refined Chunk"])  # Add headers
-
-            ws = wb[sheet_name]
-
-            # Find the next empty row
-            next_row = ws.max_row + 1
-            print(f"Appending data to row {next_row}")
-
-            # Append data directly (without DataFrame)
-            ws.append([original_chunk, refined_chunk])
-
-            # Save the workbook
-            wb.save(excel_filename)
-            print("Data successfully appended to the next row.")
-
+            entry = self._comparison_files.get(project_name)
+            if entry is None:
+                csv_filename = f"{project_name}_refined_chunks_comparison.csv"
+                write_header = not os.path.exists(csv_filename)
+                fh = open(csv_filename, "a", newline="", encoding="utf-8")
+                writer = csv.writer(fh)
+                if write_header:
+                    writer.writerow(
+                        ["Document", "Chunk Index", "Original Chunk", "Refined Chunk"])
+                entry = self._comparison_files[project_name] = (fh, writer)
+
+            entry[1].writerow(
+                [document, chunk_index, str(original_chunk), refined_chunk])
         except Exception as e:
-            print(f"Error: {e}")
\ No newline at end of file
+            logger.error(f"Error appending comparison row: {e}")
+
+    def flush_comparisons(self):
+        """Flush every open comparison CSV to disk."""
+        for fh, _ in self._comparison_files.values():
+            try:
+                fh.flush()
+            except Exception as e:
+                logger.error(f"Error flushing {fh.name}: {e}")
\ No newline at end of file